@@ -0,0 +1 @@
+"""PocketLog: hourly syslog files shipped to S3."""
@@ -0,0 +1,870 @@
+"""
+PocketLog uploader
+- Uploads /var/log/pocketlog/YYYY-MM-DD-HH.log.{gz,zst} to s3://<bucket>/<prefix>/YYYY/MM/DD/...
+- Reads /etc/pocketlog/pocketlog.conf for settings.
+- Skips current/very-recent files using MIN_AGE_SEC.
+- Uploads up to UPLOAD_CONCURRENCY files in parallel over one shared client.
+- Skips files already in S3 with the same size and sha256 (x-amz-meta-sha256).
+- Files over LARGE_FILE_THRESHOLD_MB go up as multipart parts from a process pool.
+- CONSOLIDATE_DAYS="true" ships each finished day as one YYYY-MM-DD.tar of its hourly files,
+  keeping them local until then; hours already in S3 as their own object are left out.
+- UPLOAD_BACKEND="asyncio" drives uploads from one event loop via aioboto3 (optional).
+- --daemon keeps one process (and its loaded botocore models) alive: it uploads each
+  file as soon as inotify reports it closed/renamed into LOG_ROOT, and rescans every
+  POLL_INTERVAL_SEC as a safety net (polling only, where inotify is unavailable).
+  Each pass re-reads the config; clients are rebuilt when it or the AWS credential
+  files change, or on SIGHUP (systemctl reload).
+"""
+
+import argparse
+import asyncio
+import ctypes
+import functools
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import select
+import signal
+import socket
+import struct
+import tarfile
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import BotoCoreError, ClientError
+except Exception as e:
+    raise SystemExit(f"ERROR: boto3 required in venv. Install with pip. ({e})")
+
+try:
+    from botocore.compat import HAS_CRT  # CRC32C needs awscrt (pip install "botocore[crt]")
+except ImportError:
+    HAS_CRT = False
+
+try:
+    from boto3.s3.transfer import S3Transfer
+    # Conditional writes, where this s3transfer passes IfNoneMatch through
+    HAS_IF_NONE_MATCH = "IfNoneMatch" in S3Transfer.ALLOWED_UPLOAD_ARGS
+except (ImportError, AttributeError):
+    HAS_IF_NONE_MATCH = False
+
+CONF_PATH = Path("/etc/pocketlog/pocketlog.conf")
+DEFAULTS = {
+    "S3_BUCKET": "",
+    "S3_PREFIX": "pocketlog",
+    "LOG_ROOT": "/var/log/pocketlog",
+    "DELETE_AFTER_UPLOAD": "true",
+    "MIN_AGE_SEC": "120",
+    "UPLOAD_CONCURRENCY": "8",
+    "MULTIPART_THRESHOLD_MB": "16",
+    "MULTIPART_CHUNKSIZE_MB": "16",
+    "PART_CONCURRENCY": "8",
+    "LARGE_FILE_THRESHOLD_MB": "256",
+    "UPLOAD_BACKEND": "threads",
+    "POLL_INTERVAL_SEC": "900",
+    "S3_STORAGE_CLASS": "STANDARD",
+    "S3_CHECKSUM_ALGORITHM": "auto",
+    "CONSOLIDATE_DAYS": "false",
+    "CONSOLIDATE_AFTER_HOURS": "6",
+}
+
+MIB = 1024 * 1024
+MAX_PARTS = 10000  # S3 multipart limit
+MIN_PART_SIZE = 5 * MIB  # S3 minimum for every part but the last
+CHECKSUM_ALGORITHMS = {"CRC32", "CRC32C", "CRC64NVME", "SHA1", "SHA256"}
+CRT_CHECKSUMS = {"CRC32C", "CRC64NVME"}  # botocore computes these only through awscrt
+
+# Matches files like 2025-10-28-13.log.gz or 2025-10-28-13.log.zst
+HOURLY_GZ_RE = re.compile(r"^(?P<y>\d{4})-(?P<m>\d{2})-(?P<d>\d{2})-(?P<h>\d{2})\.log\.(?:gz|zst)$")
+HOURLY_SUFFIXES = (".log.gz", ".log.zst")
+HOURLY_NAME_LENS = {len("2025-10-28-13" + sfx) for sfx in HOURLY_SUFFIXES}
+
+# Upload headers per compressed extension
+CONTENT_HEADERS = {
+    ".gz": {"ContentType": "application/gzip", "ContentEncoding": "gzip"},
+    ".zst": {"ContentType": "application/zstd", "ContentEncoding": "zstd"},
+}
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+
+# KEY=VALUE, KEY="VALUE" or KEY='VALUE'; comments and blank lines never match
+CONF_KV_RE = re.compile(
+    r"""^[ \t]*(\w+)[ \t]*=[ \t]*(?:"([^"\n]*)"|'([^'\n]*)'|([^\n]*?))[ \t]*\r?$""",
+    re.M,
+)
+
+def load_conf(path: Path) -> Dict[str, str]:
+    """Load simple KEY=VALUE (quoted or unquoted) config file."""
+    conf = DEFAULTS.copy()
+    try:
+        text = path.read_text()
+    except FileNotFoundError:
+        logging.warning("Config %s not found; using defaults. Set S3_BUCKET!", path)
+        return conf
+
+    for k, dq, sq, bare in CONF_KV_RE.findall(text):
+        conf[k] = dq or sq or bare
+    return conf
+
+def to_bool(val: str) -> bool:
+    return str(val).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+def to_int(cfg: Dict[str, str], key: str) -> int:
+    """Parse a positive integer setting, falling back to DEFAULTS on bad input."""
+    try:
+        val = int(cfg[key])
+    except (KeyError, ValueError):
+        val = int(DEFAULTS[key])
+    return val if val > 0 else int(DEFAULTS[key])
+
+def find_ready_gz(log_root: Path, min_age_sec: int, fresh: FrozenSet[str] = frozenset()):
+    """Yield DirEntry objects for .log.gz/.log.zst files older than min_age_sec and matching our pattern.
+
+    Names in fresh were reported complete by inotify and skip the age check.
+    The entry's stat() result is cached, so callers can read size/mtime
+    again without another syscall.
+    """
+    now = time.time()
+    try:
+        it = os.scandir(log_root)
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            name = entry.name
+            # Cheap length/suffix reject before running the regex
+            if len(name) not in HOURLY_NAME_LENS or not name.endswith(HOURLY_SUFFIXES):
+                continue
+            if not HOURLY_GZ_RE.match(name):
+                continue
+            try:
+                # is_file() answers from the dirent type for regular files
+                if not entry.is_file():
+                    continue
+                age = now - entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if age < min_age_sec and name not in fresh:
+                continue
+            yield entry
+
+def norm_prefix(prefix: str) -> str:
+    return prefix.strip().strip("/")
+
+def s3_key(prefix: str, filename: str) -> str:
+    """Key for a YYYY-MM-DD-... filename; the date is sliced from the name. prefix is pre-normalized."""
+    y, m, d = filename[0:4], filename[5:7], filename[8:10]
+    if prefix:
+        return f"{prefix}/{y}/{m}/{d}/{filename}"
+    return f"{y}/{m}/{d}/{filename}"
+
+def client_config(pool_size: int, config_cls=Config) -> Config:
+    """Shared-client settings: warm keep-alive pool, adaptive retries that absorb 503 SlowDown."""
+    return config_cls(
+        max_pool_connections=pool_size,
+        tcp_keepalive=True,
+        connect_timeout=3,
+        read_timeout=60,
+        retries={"mode": "adaptive", "max_attempts": 10},
+    )
+
+@functools.lru_cache(maxsize=None)
+def s3_client(pool_size: int):
+    """Create the shared client on first use and keep it for the life of the process.
+
+    Building a client loads botocore's S3 model from disk; idle runs never pay it,
+    and --daemon pays it once.
+    """
+    return boto3.client("s3", config=client_config(pool_size))
+
+def transfer_config(cfg: Dict[str, str]) -> TransferConfig:
+    """Multipart settings for s3.upload_file; parts of one object go up in parallel."""
+    return TransferConfig(
+        multipart_threshold=to_int(cfg, "MULTIPART_THRESHOLD_MB") * MIB,
+        multipart_chunksize=to_int(cfg, "MULTIPART_CHUNKSIZE_MB") * MIB,
+        max_concurrency=to_int(cfg, "PART_CONCURRENCY"),
+        use_threads=True,
+    )
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(MIB), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def head_absent(e: ClientError) -> bool:
+    """True if a HeadObject error means "go ahead and upload"."""
+    code = e.response.get("Error", {}).get("Code")
+    # Write-only credentials (PutObject without GetObject) cannot HEAD; just upload.
+    return code in ("404", "NoSuchKey", "NotFound", "403", "AccessDenied", "Forbidden")
+
+def head_matches(head: Dict, size: int, digest: str) -> bool:
+    if head["ContentLength"] != size:
+        return False
+    remote_digest = head.get("Metadata", {}).get("sha256")
+    return remote_digest is None or remote_digest == digest
+
+def remote_matches(s3, bucket: str, key: str, size: int, digest: str) -> bool:
+    """True if s3://bucket/key already holds this file (same size, and same sha256 if recorded)."""
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if head_absent(e):
+            return False
+        raise
+    return head_matches(head, size, digest)
+
+def upload_base_args(cfg: Dict[str, str]) -> Dict[str, str]:
+    """StorageClass and ChecksumAlgorithm sent with every upload; ValueError if unusable.
+
+    An empty storage class is left to S3 (STANDARD). "auto" (or empty) picks CRC32C
+    (hardware-accelerated, via awscrt) when available, else CRC32; "none" sends none.
+    """
+    base = {}
+    storage_class = cfg["S3_STORAGE_CLASS"].strip().upper()
+    if storage_class:
+        base["StorageClass"] = storage_class
+    algo = cfg["S3_CHECKSUM_ALGORITHM"].strip().upper() or "AUTO"
+    if algo == "AUTO":
+        algo = "CRC32C" if HAS_CRT else "CRC32"
+    if algo in ("NONE", "OFF"):
+        return base
+    if algo not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"S3_CHECKSUM_ALGORITHM={algo!r} is not one of auto, none, "
+                         + ", ".join(sorted(CHECKSUM_ALGORITHMS)))
+    if algo in CRT_CHECKSUMS and not HAS_CRT:
+        raise ValueError(f'S3_CHECKSUM_ALGORITHM={algo} needs awscrt '
+                         f'(pip install "botocore[crt]") or use auto')
+    base["ChecksumAlgorithm"] = algo
+    return base
+
+def extra_args(path: Path, digest: str, base: Dict[str, str]) -> Dict:
+    return dict(CONTENT_HEADERS[path.suffix], Metadata={"sha256": digest}, **base)
+
+def put_small(s3, bucket: str, key: str, body: bytes, extra: Dict) -> None:
+    """Single PutObject from an in-memory body.
+
+    A bytes body goes to the socket in one sendall; a file object would be
+    fed through http.client in 8 KiB reads.
+    """
+    s3.put_object(Bucket=bucket, Key=key, Body=body, **extra)
+
+def upload_file(s3, bucket: str, key: str, path: Path, tc: TransferConfig, extra: Dict) -> None:
+    s3.upload_file(str(path), bucket, key, ExtraArgs=extra, Config=tc)
+
+# Per-process client for part workers (created by init_part_worker)
+_part_s3 = None
+
+def init_part_worker() -> None:
+    global _part_s3
+    _part_s3 = boto3.client("s3", config=client_config(1))
+
+def upload_part_range(bucket: str, key: str, upload_id: str, part_number: int,
+                      path: str, offset: int, length: int, algo: str) -> Dict:
+    """Runs in a part worker process: pread one slice of path and upload it as one part."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        body = os.pread(fd, length, offset)
+    finally:
+        os.close(fd)
+    resp = _part_s3.upload_part(
+        Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+        Body=body, ChecksumAlgorithm=algo,
+    )
+    field = f"Checksum{algo}"
+    return {"PartNumber": part_number, "ETag": resp["ETag"], field: resp[field]}
+
+class PartPool:
+    """Part worker processes shared by every large upload in one pass.
+
+    Started on first use, so passes without large files spawn nothing, and
+    capped however many large files are in flight. Processes only pay off up to
+    one per CPU (TLS is CPU-bound); each extra one just holds a client and a part.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = min(workers, os.cpu_count() or 1)
+        self._ex: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._ex is None:
+                # forkserver: never fork() a parent that is running upload threads
+                self._ex = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"),
+                    initializer=init_part_worker,
+                )
+        return self._ex.submit(fn, *args)
+
+    def __enter__(self) -> "PartPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._ex is not None:
+            self._ex.shutdown(cancel_futures=True)
+
+def upload_large(s3, bucket: str, key: str, path: Path, size: int, tc: TransferConfig,
+                 extra: Dict, pool: PartPool) -> None:
+    """Multipart upload with the parts sent by the pass's part worker processes.
+
+    Threads in one interpreter serialize on the GIL for TLS encryption; separate
+    processes do not. All parts are queued at once so a slow part never holds
+    back the next batch. The upload is aborted on any failure.
+    """
+    part_size = max(tc.multipart_chunksize, MIN_PART_SIZE, -(-size // MAX_PARTS))
+    # Parts must carry the checksum declared at create; CRC32 is s3transfer's default too
+    algo = extra.get("ChecksumAlgorithm") or "CRC32"
+    mpu = s3.create_multipart_upload(Bucket=bucket, Key=key, **dict(extra, ChecksumAlgorithm=algo))
+    upload_id = mpu["UploadId"]
+    futs = []
+    try:
+        futs = [
+            pool.submit(upload_part_range, bucket, key, upload_id, n, str(path),
+                        offset, min(part_size, size - offset), algo)
+            for n, offset in enumerate(range(0, size, part_size), start=1)
+        ]
+        parts = [fut.result() for fut in as_completed(futs)]
+        parts.sort(key=lambda p: p["PartNumber"])
+        s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        for fut in futs:
+            fut.cancel()  # free the shared pool for the other large files
+        try:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except (BotoCoreError, ClientError) as e:
+            logging.warning("Could not abort multipart upload %s for %s: %s", upload_id, key, e)
+        raise
+
+def ship(s3, bucket: str, key: str, path: Path, size: int, tc: TransferConfig,
+         large_at: int, base: Dict[str, str], pool: PartPool) -> bool:
+    """Upload path unless S3 already has it. Returns False when the upload was skipped."""
+    if size < tc.multipart_threshold:
+        # Read once: the same buffer is hashed and sent
+        body = path.read_bytes()
+        digest = hashlib.sha256(body).hexdigest()
+        if remote_matches(s3, bucket, key, len(body), digest):
+            return False
+        put_small(s3, bucket, key, body, extra_args(path, digest, base))
+        return True
+    digest = sha256_file(path)
+    if remote_matches(s3, bucket, key, size, digest):
+        return False
+    extra = extra_args(path, digest, base)
+    if size >= large_at:
+        upload_large(s3, bucket, key, path, size, tc, extra, pool)
+    else:
+        upload_file(s3, bucket, key, path, tc, extra)
+    return True
+
+def drop_cache(path: Path) -> None:
+    """Tell the kernel the file's pages will not be read again."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+def release_local(paths, delete_after: bool) -> None:
+    """Once the batch has drained: unlink shipped files, or evict kept ones from the page cache.
+
+    Sorted so files in the same directory are handled back to back.
+    """
+    for path in sorted(paths):
+        if not delete_after:
+            drop_cache(path)
+            continue
+        try:
+            path.unlink()
+            logging.info("Deleted local file %s", path)
+        except FileNotFoundError:
+            pass
+
+def upload_threads(cfg: Dict[str, str], bucket: str, jobs, tc: TransferConfig):
+    """Yield (path, key, sent-or-exception) for each job as its upload finishes."""
+    # botocore clients are thread-safe, so one client (and one connection pool
+    # sized for every file and part in flight) is shared by every upload thread.
+    workers = to_int(cfg, "UPLOAD_CONCURRENCY")
+    large_at = to_int(cfg, "LARGE_FILE_THRESHOLD_MB") * MIB
+    base = upload_base_args(cfg)
+    s3 = s3_client(workers * tc.max_concurrency)
+    with PartPool(tc.max_concurrency) as pool, ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = {
+            ex.submit(ship, s3, bucket, key, path, size, tc, large_at, base, pool): (path, key)
+            for path, key, size in jobs
+        }
+        for fut in as_completed(futs):
+            path, key = futs[fut]
+            try:
+                yield path, key, fut.result()
+            except Exception as e:
+                yield path, key, e
+
+async def aremote_matches(s3, bucket: str, key: str, size: int, digest: str) -> bool:
+    try:
+        head = await s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if head_absent(e):
+            return False
+        raise
+    return head_matches(head, size, digest)
+
+async def aship(s3, sem: asyncio.Semaphore, bucket: str, key: str, path: Path, size: int,
+                tc: TransferConfig, large_at: int, base: Dict[str, str], pool: PartPool) -> bool:
+    """Async twin of ship(); disk reads and hashing run in the default executor."""
+    async with sem:
+        if size < tc.multipart_threshold:
+            body = await asyncio.to_thread(path.read_bytes)
+            digest = hashlib.sha256(body).hexdigest()
+            if await aremote_matches(s3, bucket, key, len(body), digest):
+                return False
+            await s3.put_object(Bucket=bucket, Key=key, Body=body, **extra_args(path, digest, base))
+            return True
+        digest = await asyncio.to_thread(sha256_file, path)
+        if await aremote_matches(s3, bucket, key, size, digest):
+            return False
+        extra = extra_args(path, digest, base)
+        if size >= large_at:
+            # Parts go through the process pool; drive it from a worker thread
+            await asyncio.to_thread(upload_large, s3_client(tc.max_concurrency),
+                                    bucket, key, path, size, tc, extra, pool)
+            return True
+        await s3.upload_file(str(path), bucket, key, ExtraArgs=extra, Config=tc)
+        return True
+
+@functools.lru_cache(maxsize=None)
+def aio_session():
+    import aioboto3
+    return aioboto3.Session()
+
+def upload_asyncio(cfg: Dict[str, str], bucket: str, jobs, tc: TransferConfig):
+    """Return (path, key, sent-or-exception) for each job, uploaded from one event loop.
+
+    Needs aioboto3 (uvloop is used when installed); returns None if it is missing.
+    """
+    try:
+        from aiobotocore.config import AioConfig
+        session = aio_session()
+    except ImportError as e:
+        logging.warning("UPLOAD_BACKEND=asyncio needs aioboto3 (%s); using threads.", e)
+        return None
+    try:
+        import uvloop
+        run = uvloop.run  # uvloop >= 0.18
+    except (ImportError, AttributeError):
+        run = asyncio.run
+
+    workers = to_int(cfg, "UPLOAD_CONCURRENCY")
+    large_at = to_int(cfg, "LARGE_FILE_THRESHOLD_MB") * MIB
+    base = upload_base_args(cfg)
+
+    async def _one(s3, sem, pool, path, key, size):
+        try:
+            return path, key, await aship(s3, sem, bucket, key, path, size, tc, large_at, base, pool)
+        except Exception as e:
+            return path, key, e
+
+    async def _amain():
+        sem = asyncio.Semaphore(workers)
+        config = client_config(workers * tc.max_concurrency, AioConfig)
+        with PartPool(tc.max_concurrency) as pool:
+            async with session.client("s3", config=config) as s3:
+                return await asyncio.gather(*[_one(s3, sem, pool, p, k, n) for p, k, n in jobs])
+
+    return run(_amain())
+
+class TarStream(io.RawIOBase):
+    """Read-only, uncompressed tar of already-compressed files, generated as it is read.
+
+    Nothing is staged on disk. A member that changes size mid-read raises from
+    read(), which fails (and aborts) the upload instead of shipping a short archive.
+    """
+
+    def __init__(self, members: List[Tuple[str, Path, int, float]]):
+        self._chunks = self._generate(members)
+        self._buf = memoryview(b"")
+
+    @staticmethod
+    def _generate(members):
+        for arcname, path, size, mtime in members:
+            info = tarfile.TarInfo(arcname)
+            info.size, info.mtime, info.mode = size, int(mtime), 0o644
+            yield info.tobuf(format=tarfile.USTAR_FORMAT)
+            sent = 0
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(MIB), b""):
+                    sent += len(chunk)
+                    yield chunk
+            if sent != size:
+                raise OSError(f"{path} changed size while archiving")
+            yield tarfile.NUL * (-size % tarfile.BLOCKSIZE)
+        yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            try:
+                self._buf = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+def member_tag(entry) -> str:
+    """'HH.log.gz:size' -- identifies one hourly file inside its day's archive."""
+    return f"{entry.name[11:]}:{entry.stat().st_size}"
+
+def archived_members(s3, bucket: str, key: str) -> Optional[Set[str]]:
+    """Member tags recorded on an existing day archive, or None if there is none.
+
+    Unlike remote_matches, a 403 raises: without HEAD we cannot tell whether a new
+    archive would overwrite one that already holds other files.
+    """
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return set(filter(None, head.get("Metadata", {}).get("members", "").split(",")))
+
+def ship_day(s3, bucket: str, prefix: str, key: str, entries, tc: TransferConfig,
+             base: Dict[str, str]) -> Tuple[List[Path], list, int]:
+    """Ship one day's hourly files as a single tar object.
+
+    Returns (paths now covered by S3, entries left for per-file upload, files uploaded).
+    If the archive already exists, only files recorded in it count as covered; any
+    newcomer for that day is left for the normal per-file path, never overwriting it.
+    Hours already uploaded as their own object (before consolidation was enabled, or
+    by a failed archive's fallback) are covered as they are and left out of the tar.
+    The PUT is conditional (If-None-Match: *) where s3transfer supports it.
+    """
+    tags = {member_tag(e): e for e in entries}
+
+    def split(remote):
+        covered = [Path(e.path) for t, e in tags.items() if t in remote]
+        if covered:
+            logging.info("Skipped %d file(s), already in s3://%s/%s", len(covered), bucket, key)
+        return covered, [e for t, e in tags.items() if t not in remote], 0
+
+    remote = archived_members(s3, bucket, key)
+    if remote is not None:
+        return split(remote)
+
+    hourly = [Path(e.path) for e in entries
+              if remote_matches(s3, bucket, s3_key(prefix, e.name), e.stat().st_size,
+                                sha256_file(Path(e.path)))]
+    if hourly:
+        logging.info("Skipped %d file(s) for s3://%s/%s, already uploaded one by one",
+                     len(hourly), bucket, key)
+        entries = [e for e in entries if Path(e.path) not in hourly]
+        tags = {member_tag(e): e for e in entries}
+        if not entries:
+            return hourly, [], 0
+
+    members = [(e.name, Path(e.path), e.stat().st_size, e.stat().st_mtime)
+               for e in sorted(entries, key=lambda e: e.name)]
+    extra = dict(ContentType="application/x-tar", Metadata={"members": ",".join(sorted(tags))}, **base)
+    if HAS_IF_NONE_MATCH:
+        extra["IfNoneMatch"] = "*"  # HEAD-then-PUT is not atomic: never replace an archive
+    try:
+        with io.BufferedReader(TarStream(members), buffer_size=MIB) as body:
+            s3.upload_fileobj(body, bucket, key, ExtraArgs=extra, Config=tc)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("PreconditionFailed",
+                                                            "ConditionalRequestConflict"):
+            raise
+        remote = archived_members(s3, bucket, key)  # another writer got there first
+        if remote is None:
+            raise
+        covered, left, _ = split(remote)
+        return hourly + covered, left, 0
+    return hourly + [m[1] for m in members], [], len(members)
+
+def consolidate(cfg: Dict[str, str], bucket: str, prefix: str, entries, tc: TransferConfig):
+    """Ship every finished day (CONSOLIDATE_AFTER_HOURS past midnight) as one archive.
+
+    Files of days not yet finished are held back, so they are not shipped twice
+    (hourly now, then again in their day's archive).
+    Returns (entries still to upload one by one, paths now covered by S3, files uploaded).
+    """
+    days: Dict[str, list] = {}
+    for entry in entries:
+        days.setdefault(entry.name[:10], []).append(entry)
+    grace = to_int(cfg, "CONSOLIDATE_AFTER_HOURS") * 3600
+    now = time.time()
+    base = upload_base_args(cfg)
+    s3 = s3_client(tc.max_concurrency)
+
+    rest, covered, uploaded, held = [], [], 0, 0
+    for day, day_entries in sorted(days.items()):
+        y, m, d = (int(x) for x in day.split("-"))
+        day_end = time.mktime((y, m, d + 1, 0, 0, 0, 0, 0, -1))  # local time, like rsyslog's $hour
+        if now - day_end < grace:
+            held += len(day_entries)
+            continue
+        key = s3_key(prefix, f"{day}.tar")
+        try:
+            done, left, sent = ship_day(s3, bucket, prefix, key, day_entries, tc, base)
+        except Exception as e:
+            logging.error("Failed to archive %s -> s3://%s/%s (%s); uploading its files one by one",
+                          day, bucket, key, e)
+            rest += day_entries
+            continue
+        if sent:
+            logging.info("Uploaded %d file(s) for %s as s3://%s/%s", sent, day, bucket, key)
+        covered += done
+        rest += left
+        uploaded += sent
+    if held:
+        logging.info("Holding %d file(s) until their day's archive is due", held)
+    return rest, covered, uploaded
+
+def run_once(cfg: Dict[str, str], tc: TransferConfig, fresh: FrozenSet[str] = frozenset()) -> int:
+    """One scan-and-upload pass over LOG_ROOT. Returns the number of files uploaded."""
+    bucket = cfg["S3_BUCKET"].strip()
+    prefix = norm_prefix(cfg["S3_PREFIX"])
+    log_root = Path(cfg["LOG_ROOT"])
+    delete_after = to_bool(cfg["DELETE_AFTER_UPLOAD"])
+    try:
+        min_age = int(cfg["MIN_AGE_SEC"])
+    except ValueError:
+        min_age = int(DEFAULTS["MIN_AGE_SEC"])
+
+    entries = list(find_ready_gz(log_root, min_age, fresh))
+    uploaded = skipped = 0
+    done = []
+    if entries and to_bool(cfg["CONSOLIDATE_DAYS"]):
+        entries, done, uploaded = consolidate(cfg, bucket, prefix, entries, tc)
+
+    jobs = [
+        (Path(entry.path), s3_key(prefix, entry.name), entry.stat().st_size)
+        for entry in entries
+    ]
+    results = None
+    if jobs and cfg["UPLOAD_BACKEND"].strip().lower() == "asyncio":
+        results = upload_asyncio(cfg, bucket, jobs, tc)
+    if jobs and results is None:
+        results = upload_threads(cfg, bucket, jobs, tc)
+
+    for gz_path, key, sent in results or ():
+        if isinstance(sent, (BotoCoreError, ClientError)):
+            logging.error("Failed to upload %s -> s3://%s/%s: %s", gz_path, bucket, key, sent)
+            continue
+        if isinstance(sent, Exception):
+            logging.error("Unexpected error uploading %s: %s", gz_path, sent)
+            continue
+        if sent:
+            logging.info("Uploaded %s to s3://%s/%s", gz_path, bucket, key)
+            uploaded += 1
+        else:
+            logging.info("Skipped %s, already present at s3://%s/%s", gz_path, bucket, key)
+            skipped += 1
+        done.append(gz_path)
+    release_local(done, delete_after)
+
+    if skipped:
+        logging.info("Skipped %d file(s) already in S3.", skipped)
+    print(f"Uploaded {uploaded} file(s).", flush=True)
+    return uploaded
+
+# inotify(7) constants and struct inotify_event header (wd, mask, cookie, len)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_EVENT = struct.Struct("iIII")
+# Wait this long after an event for the rest of a burst (e.g. several hours compressed at once)
+SETTLE_SEC = 1.0
+
+def inotify_open(path: Path) -> Optional[int]:
+    """Non-blocking inotify fd watching path for completed files, or None if unavailable."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        logging.warning("inotify watch on %s failed: %s", path, os.strerror(ctypes.get_errno()))
+        os.close(fd)
+        return None
+    return fd
+
+def inotify_names(fd: int) -> List[str]:
+    """Drain pending events and return the file names they refer to."""
+    names = []
+    while True:
+        try:
+            buf = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        off = 0
+        while off < len(buf):
+            _wd, _mask, _cookie, length = IN_EVENT.unpack_from(buf, off)
+            off += IN_EVENT.size
+            raw = buf[off:off + length].rstrip(b"\0")
+            off += length
+            if raw:
+                names.append(os.fsdecode(raw))
+
+def sd_notify(state: str) -> None:
+    """Minimal sd_notify(3) for Type=notify units; a no-op outside systemd."""
+    addr = os.environ.get("NOTIFY_SOCKET")
+    if not addr:
+        return
+    if addr.startswith("@"):
+        addr = "\0" + addr[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode(), addr)
+    except OSError as e:
+        logging.warning("sd_notify failed: %s", e)
+
+def aws_config_files() -> List[Path]:
+    aws_dir = Path.home() / ".aws"
+    return [
+        Path(os.environ.get("AWS_SHARED_CREDENTIALS_FILE", aws_dir / "credentials")),
+        Path(os.environ.get("AWS_CONFIG_FILE", aws_dir / "config")),
+    ]
+
+def settings_stamp() -> Tuple:
+    """mtimes of pocketlog.conf and the AWS credential files; changes when any is edited."""
+    stamp = []
+    for path in [CONF_PATH, *aws_config_files()]:
+        try:
+            stamp.append(path.stat().st_mtime_ns)
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+def reset_clients() -> None:
+    """Forget cached clients and resolved credentials; the next upload rebuilds them."""
+    s3_client.cache_clear()
+    aio_session.cache_clear()
+    boto3.DEFAULT_SESSION = None
+
+def daemon_pass(fresh: FrozenSet[str] = frozenset()) -> None:
+    """Re-read the config (cheap) and run one pass; errors are logged, never raised."""
+    cfg = load_conf(CONF_PATH)
+    if not cfg["S3_BUCKET"].strip():
+        logging.error("S3_BUCKET is empty in %s. Set it (picked up on the next pass).", CONF_PATH)
+        return
+    try:
+        upload_base_args(cfg)
+    except ValueError as e:
+        logging.error("%s (%s); skipping this pass.", e, CONF_PATH)
+        return
+    try:
+        run_once(cfg, transfer_config(cfg), fresh)
+    except Exception as e:
+        logging.error("Upload pass failed: %s", e)
+
+def hup_pipe() -> int:
+    """Read end of a pipe that becomes readable whenever SIGHUP arrives."""
+    r, w = os.pipe()
+    os.set_blocking(r, False)
+    os.set_blocking(w, False)
+
+    def _on_hup(_signum, _frame):
+        try:
+            os.write(w, b"\0")
+        except BlockingIOError:
+            pass
+
+    signal.signal(signal.SIGHUP, _on_hup)
+    return r
+
+def daemon() -> None:
+    """Run forever. LOG_ROOT and POLL_INTERVAL_SEC are read once; changing them needs a restart."""
+    cfg = load_conf(CONF_PATH)
+    interval = to_int(cfg, "POLL_INTERVAL_SEC")
+    log_root = Path(cfg["LOG_ROOT"])
+    fd = inotify_open(log_root)
+    if fd is None:
+        logging.info("Daemon mode: scanning %s every %ds", log_root, interval)
+    else:
+        logging.info("Daemon mode: watching %s (rescan every %ds)", log_root, interval)
+    hup = hup_pipe()
+    watched = [hup] if fd is None else [hup, fd]
+    sd_notify("READY=1")
+
+    stamp = settings_stamp()
+    daemon_pass()  # backlog left from before we started
+    next_scan = time.monotonic() + interval
+    while True:
+        timeout = max(0.0, next_scan - time.monotonic())
+        ready = select.select(watched, [], [], timeout)[0]
+        fresh = frozenset()
+        if hup in ready:
+            while True:
+                try:
+                    if not os.read(hup, 64):
+                        break
+                except BlockingIOError:
+                    break
+            logging.info("SIGHUP: reloading config and credentials")
+            stamp = None
+        elif fd in ready:
+            names = inotify_names(fd)
+            while select.select([fd], [], [], SETTLE_SEC)[0]:
+                names += inotify_names(fd)
+            fresh = frozenset(n for n in names if HOURLY_GZ_RE.match(n))
+            if not fresh:
+                continue
+        now_stamp = settings_stamp()
+        if now_stamp != stamp:
+            if stamp is not None:
+                logging.info("Config or AWS credentials changed; reloading")
+            reset_clients()
+            stamp = now_stamp
+        daemon_pass(fresh)
+        if not fresh:
+            next_scan = time.monotonic() + interval
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Upload hourly PocketLog files to S3.")
+    ap.add_argument("--daemon", action="store_true",
+                    help="stay running; upload files as they appear in LOG_ROOT")
+    args = ap.parse_args(argv)
+
+    cfg = load_conf(CONF_PATH)
+    try:
+        upload_base_args(cfg)  # fail fast rather than on every upload
+    except ValueError as e:
+        logging.error("%s (%s)", e, CONF_PATH)
+        return 1
+    if args.daemon:
+        daemon()
+        return 0
+    if not cfg["S3_BUCKET"].strip():
+        logging.error("S3_BUCKET is empty in %s. Set it and retry.", CONF_PATH)
+        return 1
+    run_once(cfg, transfer_config(cfg))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
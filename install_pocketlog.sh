@@ -2,8 +2,8 @@
 # install_pocketlog.sh — PocketLog bootstrap for Raspberry Pi OS (Debian Trixie)
 # - rsyslog writes ONE combined file per hour: /var/log/pocketlog/YYYY-MM-DD-HH.log
 # - Each line: _time=<rfc3339> host=<sender-ip> msg='<raw payload exactly as received>'
-# - A tiny hourly compressor gzips previous-hour files; pocketlog.py uploads .log.gz to S3
-# - Installs systemd timer to run uploader every 15 minutes
+# - A tiny hourly compressor zstd-compresses (or gzips) previous-hour files; pocketlog.py (+ pocketlog/ package) uploads them to S3
+# - Installs a systemd service running the uploader as an inotify-driven daemon
 
 set -euo pipefail
 
@@ -31,9 +31,10 @@ say "Refreshing apt cache..."
 apt-get update -y
 
 say "Installing base packages..."
-DEBIAN_FRONTEND=noninteractive apt-get install -y \
+# One dpkg transaction; skip Recommends the Pi does not need
+DEBIAN_FRONTEND=noninteractive apt-get install -y --no-install-recommends \
   rsyslog python3-venv python3-pip \
-  awscli logrotate gzip jq tcpdump git ca-certificates
+  awscli logrotate gzip zstd jq tcpdump git ca-certificates
 
 say "Creating log and config directories..."
 install -d -m 0755 "${LOG_DIR}"
@@ -77,10 +78,15 @@ say "Installing rsyslog drop-ins…"
 # Choose a single port and use it consistently
 PORT="${PORT:-514}"
 
+# UDP receive threads: one per core, capped at 4
+CORES="$(nproc 2>/dev/null || echo 1)"
+UDP_THREADS="${UDP_THREADS:-$(( CORES < 4 ? CORES : 4 ))}"
+
 # 00-load-inputs.conf — explicitly load UDP/TCP modules
-write_file "/etc/rsyslog.d/00-load-inputs.conf" root 0644 <<'RSY'
-module(load="imudp")
-module(load="imtcp")
+write_file "/etc/rsyslog.d/00-load-inputs.conf" root 0644 <<RSY
+# Drain UDP sockets from ${UDP_THREADS} threads, up to 128 datagrams per recvmmsg()
+module(load="imudp" threads="${UDP_THREADS}" batchSize="128" timeRequery="8")
+module(load="imtcp" maxSessions="2000")
 RSY
 
 # 01-remote-hourly.conf — templates + ruleset writing one combined file per hour
@@ -89,23 +95,37 @@ write_file "/etc/rsyslog.d/01-remote-hourly.conf" root 0644 <<'RSY'
 template(name="HourlyCombinedPath" type="string"
          string="/var/log/pocketlog/%$year%-%$month%-%$day%-%$hour%.log")
 
-# RAW payload wrapped in msg='...'; keep it exactly as received (trim trailing LF)
+# RAW payload wrapped in msg='...'; keep it exactly as received (trim trailing LF).
+# No mmjsonparse: payloads are never parsed here. If JSON parsing is ever added,
+# gate it with: if ($msg startswith "{" or $msg startswith " {") then { ... }
+# so non-JSON lines skip the parser entirely.
 template(name="kv_line_raw" type="string"
          string="_time=%timegenerated:::date-rfc3339% host=%fromhost-ip% msg='%msg:::drop-last-lf%'\n")
 
-# Writer ruleset used by UDP/TCP inputs
+# Writer ruleset used by UDP/TCP inputs.
+# The file action runs on its own queue so disk writes never stall the listeners:
+# - one worker keeps lines in arrival order (omfile serializes per file anyway)
+# - 50k in-memory messages, spilling to disk (WorkDirectory) past that instead of
+#   blocking; raise queue.size on hosts with RAM to spare, watch impstats for saturation
+# - 64k buffered async writes, flushed at least every second
 ruleset(name="remote_raw") {
   action(type="omfile"
          dynaFile="HourlyCombinedPath"
          template="kv_line_raw"
-         createDirs="on" dirCreateMode="0755" FileCreateMode="0644")
+         createDirs="on" dirCreateMode="0755" FileCreateMode="0644"
+         ioBufferSize="64k" flushOnTXEnd="off" asyncWriting="on" flushInterval="1"
+         queue.type="LinkedList" queue.size="50000" queue.workerThreads="1"
+         queue.dequeueBatchSize="1024"
+         queue.filename="pocketlog_remote" queue.maxDiskSpace="512m"
+         queue.saveOnShutdown="on"
+         action.resumeRetryCount="-1")
 }
 RSY
 
 # 10-network-inputs.conf — bind UDP/TCP to the ruleset above
 write_file "/etc/rsyslog.d/10-network-inputs.conf" root 0644 <<RSY
 # Bind inbound listeners to the remote_raw ruleset
-input(type="imudp" port="${PORT}" ruleset="remote_raw")
+input(type="imudp" port="${PORT}" ruleset="remote_raw" rcvbufSize="4m")
 input(type="imtcp" port="${PORT}" ruleset="remote_raw")
 RSY
 
@@ -123,6 +143,14 @@ if ($inputname == "imuxsock" or $inputname == "imklog" or
      $inputname != "imudp" and $inputname != "imtcp")) then stop
 RSY
 
+# Let the UDP listener have a 4 MiB kernel receive buffer so bursts queue in the
+# kernel instead of being dropped before rsyslog drains them. Only the listener
+# asks for it (rcvbufSize above); rmem_default is left alone for other sockets.
+write_file "/etc/sysctl.d/60-pocketlog.conf" root 0644 <<'SYSCTL'
+net.core.rmem_max = 8388608
+SYSCTL
+sysctl -q -p /etc/sysctl.d/60-pocketlog.conf || warn "Could not apply /etc/sysctl.d/60-pocketlog.conf"
+
 say "Validating rsyslog configuration…"
 rsyslogd -N1
 
@@ -143,9 +171,15 @@ now="$(date +%Y-%m-%d-%H)"
 shopt -s nullglob
 for f in "${LOGDIR}"/*.log; do
   base="$(basename "$f")"
-  # Only gzip files like 2025-10-28-13.log, not the current hour, not other logs
+  # Only compress files like 2025-10-28-13.log, not the current hour, not other logs
   if [[ "$base" =~ ^[0-9]{4}-[0-9]{2}-[0-9]{2}-[0-9]{2}\.log$ ]] && [[ "$base" != "${now}.log" ]]; then
-    gzip -n -- "$f" || true
+    # Uploads are network-bound: spend CPU once here to send fewer bytes every time.
+    # No --long: objects carry Content-Encoding: zstd, which caps the window at 8 MiB (RFC 9659).
+    if command -v zstd >/dev/null 2>&1; then
+      zstd -q -19 -T0 --rm -- "$f" || true
+    else
+      gzip -9 -n -- "$f" || true
+    fi
   fi
 done
 SH
@@ -168,12 +202,22 @@ say "Laying down PocketLog app and Python venv…"
 install -d -m 0755 "${APP_DIR}"
 install -d -m 0755 "${APP_DIR}/bin"
 
-# pocketlog.py
-if [[ -f "${REPO_ROOT}/pocketlog.py" ]]; then
-  install -m 0755 "${REPO_ROOT}/pocketlog.py" "${APP_DIR}/pocketlog.py"
-elif [[ -f "${REPO_FILES_DIR}/pocketlog.py" ]]; then
-  install -m 0755 "${REPO_FILES_DIR}/pocketlog.py" "${APP_DIR}/pocketlog.py"
+# pocketlog.py entry point + pocketlog/ package (taken together from one place)
+APP_SRC=""
+for d in "${REPO_ROOT}" "${REPO_FILES_DIR}"; do
+  if [[ -f "${d}/pocketlog.py" && -f "${d}/pocketlog/core.py" ]]; then
+    APP_SRC="$d"
+    break
+  fi
+done
+if [[ -n "${APP_SRC}" ]]; then
+  say "Installing pocketlog.py + pocketlog/ from ${APP_SRC}"
+  install -m 0755 "${APP_SRC}/pocketlog.py" "${APP_DIR}/pocketlog.py"
+  rm -rf "${APP_DIR}/pocketlog"
+  install -d -m 0755 "${APP_DIR}/pocketlog"
+  install -m 0644 "${APP_SRC}"/pocketlog/*.py "${APP_DIR}/pocketlog/"
 else
+  APP_PLACEHOLDER=1
   warn "pocketlog.py not found; dropping a no-op placeholder."
   cat >"${APP_DIR}/pocketlog.py" <<'PY'
 #!/usr/bin/env python3
@@ -196,6 +240,11 @@ else
 fi
 deactivate
 
+# Byte-compile the app for the -OO interpreter the service runs with
+if [[ -d "${APP_DIR}/pocketlog" ]]; then
+  "${VENV_DIR}/bin/python" -m compileall -q -o 2 "${APP_DIR}/pocketlog"
+fi
+
 # -----------------------------
 # A P P   C O N F I G
 # -----------------------------
@@ -208,6 +257,30 @@ S3_PREFIX="pocketlog"
 LOG_ROOT="/var/log/pocketlog"
 DELETE_AFTER_UPLOAD="true"
 MIN_AGE_SEC="120"
+# Number of files uploaded in parallel
+UPLOAD_CONCURRENCY="8"
+# Files at or above the threshold are sent as parallel multipart uploads
+MULTIPART_THRESHOLD_MB="16"
+MULTIPART_CHUNKSIZE_MB="16"
+PART_CONCURRENCY="8"
+# Files at or above this size upload their parts from min(PART_CONCURRENCY, CPUs) processes (shared)
+LARGE_FILE_THRESHOLD_MB="256"
+# STANDARD, STANDARD_IA, INTELLIGENT_TIERING, GLACIER_IR, DEEP_ARCHIVE, ... (empty = S3 default)
+# (IA/Glacier classes bill a 128 KiB minimum object size and 30-180 day minimum storage)
+S3_STORAGE_CLASS="STANDARD"
+# auto = CRC32C when awscrt is installed (pip install "botocore[crt]"), else CRC32;
+# or CRC32, CRC32C/CRC64NVME (need awscrt), SHA1, SHA256, none (multipart still uses CRC32)
+S3_CHECKSUM_ALGORITHM="auto"
+# Ship each finished day as one <prefix>/YYYY/MM/DD/YYYY-MM-DD.tar (of the hourly
+# files) once it is CONSOLIDATE_AFTER_HOURS past midnight, instead of 24 objects.
+# Files stay local until then; hours already in S3 on their own are left out of it.
+CONSOLIDATE_DAYS="false"
+CONSOLIDATE_AFTER_HOURS="6"
+# "threads" (default) or "asyncio" (needs: pip install aioboto3 [uvloop])
+UPLOAD_BACKEND="threads"
+# Safety-net rescan interval for "pocketlog.py --daemon" (new files upload immediately)
+# LOG_ROOT and this need a restart; other edits apply on the next pass (or systemctl reload)
+POLL_INTERVAL_SEC="900"
 CONF
 else
   warn "Config exists; leaving ${CONF_FILE} unchanged."
@@ -216,7 +289,13 @@ fi
 # -----------------------------
 # S Y S T E M D   U N I T S
 # -----------------------------
-say "Installing systemd service + timer for uploader (every 15 minutes)…"
+say "Installing systemd service for uploader (daemon, uploads files as they appear)…"
+# Older installs ran the uploader from a 15-minute timer; retire it
+if [[ -f /etc/systemd/system/pocketlog-upload.timer ]]; then
+  systemctl disable --now pocketlog-upload.timer >/dev/null 2>&1 || true
+  rm -f /etc/systemd/system/pocketlog-upload.timer
+fi
+
 cat >/etc/systemd/system/pocketlog-upload.service <<EOF
 [Unit]
 Description=PocketLog S3 uploader
@@ -224,15 +303,17 @@ After=network-online.target
 Wants=network-online.target
 
 [Service]
-Type=simple
+Type=notify
 User=root
 Group=root
-ExecStart=${VENV_DIR}/bin/python ${APP_DIR}/pocketlog.py
+ExecStart=${VENV_DIR}/bin/python -OO ${APP_DIR}/pocketlog.py --daemon
+ExecReload=/bin/kill -HUP \$MAINPID
 WorkingDirectory=${APP_DIR}
 Nice=10
 IOSchedulingClass=best-effort
 IOSchedulingPriority=7
-Restart=no
+Restart=on-failure
+RestartSec=30
 StandardOutput=append:${LOG_DIR}/pocketlog_uploader.log
 StandardError=append:${LOG_DIR}/pocketlog_uploader.log
 
@@ -240,23 +321,14 @@ StandardError=append:${LOG_DIR}/pocketlog_uploader.log
 WantedBy=multi-user.target
 EOF
 
-cat >/etc/systemd/system/pocketlog-upload.timer <<'EOF'
-[Unit]
-Description=Run PocketLog uploader every 15 minutes
-
-[Timer]
-OnBootSec=2min
-OnUnitActiveSec=15min
-AccuracySec=1min
-Persistent=true
-Unit=pocketlog-upload.service
-
-[Install]
-WantedBy=timers.target
-EOF
-
 systemctl daemon-reload
-systemctl enable --now pocketlog-upload.timer
+if [[ -n "${APP_PLACEHOLDER:-}" ]]; then
+  # The placeholder never sends READY=1, so a Type=notify start would fail.
+  warn "Uploader sources missing; not enabling pocketlog-upload.service."
+else
+  systemctl enable pocketlog-upload.service
+  systemctl restart pocketlog-upload.service
+fi
 
 # -----------------------------
 # S A N I T Y   C H E C K S
@@ -280,20 +352,22 @@ Next steps:
        sudo -H aws configure
   2) Set your S3 bucket/prefix:
        sudo nano /etc/pocketlog/pocketlog.conf
-  3) Send a test and confirm current-hour file appears:
+  3) Restart the uploader so it picks up the bucket and credentials:
+       sudo systemctl restart pocketlog-upload.service
+  4) Send a test and confirm current-hour file appears:
        IP=$(hostname -I | awk '{print $1}')
        logger -n "$IP" -P 514 -t pltest "hello PocketLog"
        sudo tail -n 3 /var/log/pocketlog/$(date +%Y-%m-%d-%H).log
-  4) Wait for the hour to roll (or force once):
+  5) Wait for the hour to roll (or force once):
        sudo /usr/local/sbin/pocketlog-hourly-rotate
-       ls -l /var/log/pocketlog | grep -E '\.log\.gz$' || echo "No gz yet"
-  5) Trigger an upload run now:
-       sudo systemctl start pocketlog-upload.service
+       ls -l /var/log/pocketlog | grep -E '\.log\.(gz|zst)$' || echo "No compressed files yet"
+  6) The uploader daemon ships each file as soon as it is compressed:
+       sudo systemctl status pocketlog-upload.service --no-pager
        sudo tail -n 100 /var/log/pocketlog/pocketlog_uploader.log
 
 Format on disk (per line):
   _time=<RFC3339> host=<sender-ip> msg='<raw payload exactly as received>'
 
 Uploads (by pocketlog.py):
-  s3://<bucket>/<prefix>/YYYY/MM/DD/YYYY-MM-DD-HH.log.gz
+  s3://<bucket>/<prefix>/YYYY/MM/DD/YYYY-MM-DD-HH.log.zst   (.log.gz if zstd is missing)
 NEXT